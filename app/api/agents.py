@@ -1,7 +1,12 @@
 import re
 from typing import List, Dict, Any
 from .models import Message, Product
-from .services import db
+from .data_access import db
+from .cart import Cart
+from .search import catalog_index
+from .analytics import query_analytics
+from .partitions import partitions
+from .profiles import profile_store, ANONYMOUS_USER_ID
 from thefuzz import process, fuzz
 
 class Agent:
@@ -9,11 +14,39 @@ class Agent:
         self.name = name
 
     async def process(self, input_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        # Replies that report a write (cart edit, placed order) set "committed": True so the
+        # connection delivers them even when a newer message supersedes the turn
         raise NotImplementedError
 
+def _user_id(context: Dict[str, Any]) -> str:
+    """Shopper id used for both order filing and personalization."""
+    return context.get("userId") or ANONYMOUS_USER_ID
+
+async def _catalog(context: Dict[str, Any]):
+    """Products + search index for this session: its store's partition if set, else the whole catalog."""
+    store = context.get("store")
+    if store:
+        partition = await partitions.get(store)
+        if partition:
+            return partition.products, partition.index
+    products = await db.get_products()
+    return products, catalog_index.ensure(products, db.catalog_version)
+
+def _match_product_name(text: str, products: List[Product]):
+    """Product whose name is named in `text` (already stripped of command words), or None."""
+    if not text.strip():
+        return None
+    index = catalog_index.ensure(products, db.catalog_version)
+    text = index.correct(text)
+    product_names = index.shortlist(text)
+    best_match = process.extractOne(text, product_names, scorer=fuzz.token_set_ratio) if product_names else None
+    if best_match and best_match[1] > 80:
+        return next((p for p in products if p.name == best_match[0]), None)
+    return None
+
 class RecommendationAgent(Agent):
     async def process(self, input_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        products = await db.get_products()
+        products, index = await _catalog(context)
         input_lower = input_text.lower()
         print(f"DEBUG_TRACE: Start Process. Input='{input_text}' Context={context}", flush=True)
         
@@ -52,7 +85,8 @@ class RecommendationAgent(Agent):
                  context["pending_query"] = input_text
                  return {
                      "content": "To help you better, who are you shopping for?",
-                     "options": ["Men", "Women"]
+                     "options": ["Men", "Women"],
+                     "clarification": True
                  }
         
         # Filter products by gender if set (and if product has gender attribute)
@@ -79,28 +113,45 @@ class RecommendationAgent(Agent):
         print(f"DEBUG: search_text='{search_text}', is_broad={is_broad_search}, gender={gender_filter}")
 
         # 1. Fuzzy match product names
-
-        # 1. Fuzzy match product names
-        product_names = [p.name for p in products]
+        # Only score the trigram shortlist (restricted to gender-filtered products). The shortlist
+        # is built from the spelling-corrected text ("runing shos" -> "running shoes") so typos
+        # still find their product; intent checks use what the shopper typed.
+        corrected = index.correct(search_text)
+        if corrected != search_text.lower():
+            print(f"DEBUG_TRACE: Spelling corrected '{search_text}' -> '{corrected}'")
+        shortlist = set(index.shortlist(corrected, allowed={p.name for p in products}))
+        # Keep catalog order so score ties resolve exactly as they did over the full list
+        product_names = [p.name for p in products if p.name in shortlist]
         # 1. Fuzzy match Name
         # Logic: WRatio is best overall, but "runing shos" scored 57. 
         # We lower threshold to 55, but prioritize high scores > 70.
-        best_name_match = process.extractOne(search_text, product_names, scorer=fuzz.WRatio)
+        def accepted(match, text):
+            if not match:
+                return False
+            # High confidence match; moderate confidence (typos) is confirmed with partial_ratio to be safe
+            return match[1] > 70 or (match[1] > 55 and fuzz.partial_ratio(text, match[0]) > 60)
+
+        top_names = process.extract(search_text, product_names, scorer=fuzz.WRatio, limit=2) if product_names else []
+        best_name_match = top_names[0] if top_names else None
+        name_text = search_text
+        # Fall back to the corrected text only where the typed text cannot decide: no name passes
+        # the thresholds, or the top two tie ("chekered shirt" scores 86 for both the checkered
+        # shirt and a T-shirt; "checkered shirt" picks the former at 95). A corrected query that
+        # becomes broad ("snekers for women") still goes to the category logic below.
+        typed_undecided = not accepted(best_name_match, search_text) or (
+            len(top_names) > 1 and top_names[0][1] == top_names[1][1])
+        corrected_broad = any(term in corrected for term in broad_terms)
+        if product_names and typed_undecided and corrected != search_text.lower() and not corrected_broad:
+            corrected_match = process.extractOne(corrected, product_names, scorer=fuzz.WRatio)
+            if corrected_match and (not best_name_match or corrected_match[1] > best_name_match[1]):
+                best_name_match = corrected_match
+                name_text = corrected
         
         matches = []
         # FAILSAFE: If broad search, DO NOT accept a single fuzzy match on name. 
         # We want multiple items via keyword/category logic.
-        if best_name_match and not is_broad_search:
-            score = best_name_match[1]
-            # High confidence match
-            if score > 70:
-                matches = [p for p in products if p.name == best_name_match[0]]
-            # Moderate confidence (typos), confirm with partial_ratio to be safe
-            elif score > 55:
-                # Secondary check: does it have strong partial overlap?
-                part_score = fuzz.partial_ratio(search_text, best_name_match[0])
-                if part_score > 60:
-                     matches = [p for p in products if p.name == best_name_match[0]]
+        if not is_broad_search and accepted(best_name_match, name_text):
+            matches = [p for p in products if p.name == best_name_match[0]]
             
         # 2. Fuzzy match Category if no name match
         if not matches:
@@ -181,9 +232,13 @@ class RecommendationAgent(Agent):
         if not matches:
              return {"content": "I couldn't find any specific products matching that description."}
 
+        # Personalize order using the shopper's precomputed affinity profile
+        matches = profile_store.rerank(_user_id(context), matches)
+
         # Update context with the first found product for follow-up
         context["last_product_id"] = matches[0].id
         context["last_product_name"] = matches[0].name
+        context["last_product_sku"] = matches[0].sku
         
         response = "Here are some top picks:"
         # Add context about gender if applicable
@@ -216,9 +271,11 @@ class InventoryAgent(Agent):
             target_product = next((p for p in products if p.id == pid), None)
             
         if not target_product:
-            # Fuzzy match from input
-            product_names = [p.name for p in products]
-            best_match = process.extractOne(input_text, product_names, scorer=fuzz.partial_ratio)
+            # Fuzzy match from input, scoring only the spelling-corrected trigram shortlist
+            index = catalog_index.ensure(products, db.catalog_version)
+            search_text = index.correct(input_text)
+            product_names = index.shortlist(search_text)
+            best_match = process.extractOne(search_text, product_names, scorer=fuzz.partial_ratio) if product_names else None
             if best_match and best_match[1] > 65:
                  target_product = next((p for p in products if p.name == best_match[0]), None)
 
@@ -228,7 +285,16 @@ class InventoryAgent(Agent):
         # Update context
         context["last_product_id"] = target_product.id
         context["last_product_name"] = target_product.name
+        context["last_product_sku"] = target_product.sku
         
+        # In-store sessions: answer from the store's own shelf first
+        store = context.get("store")
+        if store:
+            partition = await partitions.get(store)
+            on_shelf = partition.stock.get(target_product.sku, 0) if partition else 0
+            if on_shelf > 0:
+                return {"content": f"We have {on_shelf} '{target_product.name}' in stock here at {store}."}
+
         stock = await db.check_inventory(target_product.sku)
         total_stock = sum(stock.values())
         
@@ -251,11 +317,13 @@ class PaymentAgent(Agent):
              # and uses the stale product from the last search context.
              
              products = await db.get_products()
-             product_names = [p.name for p in products]
+             index = catalog_index.ensure(products, db.catalog_version)
+             search_text = index.correct(input_text)
+             product_names = index.shortlist(search_text)
              
              # Use token_set_ratio to handle "I want to buy [Product Name]"
              # This is safer than partial_ratio for short words like "it" matching inside "White"
-             best_match = process.extractOne(input_text, product_names, scorer=fuzz.token_set_ratio)
+             best_match = process.extractOne(search_text, product_names, scorer=fuzz.token_set_ratio) if product_names else None
              
              if best_match and best_match[1] > 80:
                  # Check if the match is better than a generic fallback
@@ -267,6 +335,7 @@ class PaymentAgent(Agent):
                      print(f"DEBUG: PaymentAgent found explicit product '{target_name}' in input (score={best_match[1]})")
                      context["last_product_id"] = matched_product.id
                      context["last_product_name"] = matched_product.name
+                     context["last_product_sku"] = matched_product.sku
 
              # Fetch product details if available in context
              product_context = None
@@ -277,26 +346,121 @@ class PaymentAgent(Agent):
                  if product:
                      product_context = product.dict()
 
+             content = "Please select a payment method:"
+             cart = Cart(context)
+             if len(cart):
+                 priced = await db.get_products_by_skus(cart.skus())
+                 cart_total = sum(priced[l["sku"]].price * l["quantity"] for l in cart.lines() if l["sku"] in priced)
+                 content = f"Your cart has {len(cart)} item(s) totalling INR {cart_total}. Please select a payment method:"
+
              return {
-                 "content": "Please select a payment method:",
+                 "content": content,
                  "options": ["UPI", "Card"],
                  "product_context": product_context
              }
              
-        if "yes" in input_lower and context.get("last_agent") == "PaymentAgent":
+        # Confirmation: "yes" or picking one of the offered payment methods
+        is_confirm = "yes" in input_lower or input_lower.strip() in ("upi", "card")
+        if is_confirm and context.get("last_agent") == "PaymentAgent":
              try:
-                # In real app, items would come from a cart
-                items = []
-                if context.get("last_product_id"):
-                     items.append({"sku": "UNKNOWN", "quantity": 1}) # Needs SKU lookup in real app
-                     
-                order_id = await db.create_order("user-123", items, 99.99)
-                return {"content": f"Payment successful! Your order ({order_id}) for {product_name} has been placed."}
+                # Items come from the cart; fall back to the product currently being discussed
+                cart = Cart(context)
+                items = cart.lines()
+                if not items and context.get("last_product_sku"):
+                     items = [{"sku": context["last_product_sku"], "quantity": 1}]
+                if not items:
+                     return {"content": "Your cart is empty. Add a product first, e.g. 'add Runner Pro Shoes to cart'."}
+
+                order_id = await db.create_order(_user_id(context), items, origin=context.get("store"))
+                if len(cart):
+                     summary = f"{len(cart)} item(s)"
+                     cart.clear()
+                else:
+                     summary = product_name
+                return {"content": f"Payment successful! Your order ({order_id}) for {summary} has been placed.", "committed": True}
              except Exception as e:
                 return {"content": f"Payment failed: {str(e)}"}
         
         return {"content": "I can assist with payments. Do you want to checkout?"}
 
+class CartAgent(Agent):
+    async def process(self, input_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        input_lower = input_text.lower()
+        cart = Cart(context)
+
+        qty_match = re.search(r"\b(\d+)\b", input_lower)
+        quantity = int(qty_match.group(1)) if qty_match else 1
+
+        is_remove = re.search(r"\b(remove|delete|drop)\b", input_lower)
+        is_update = re.search(r"\b(change|update|set|make)\b", input_lower) and qty_match
+        is_add = re.search(r"\b(add|put)\b", input_lower)
+
+        if not (is_remove or is_update or is_add):
+            return await self._summary(cart)
+
+        product = await self._resolve_product(input_text, context)
+        if not product:
+            return {"content": "Which product do you mean? Try 'add Runner Pro Shoes to cart'."}
+
+        context["last_product_id"] = product.id
+        context["last_product_name"] = product.name
+        context["last_product_sku"] = product.sku
+
+        if is_remove:
+            if not cart.remove(product.sku):
+                return {"content": f"'{product.name}' is not in your cart."}
+            result = await self._summary(cart)
+            result["content"] = f"Removed '{product.name}' from your cart.\n" + result["content"]
+            result["committed"] = True
+            return result
+
+        if is_update:
+            cart.set_quantity(product.sku, quantity)
+            result = await self._summary(cart)
+            result["content"] = f"Updated '{product.name}' to {quantity}.\n" + result["content"]
+            result["committed"] = True
+            return result
+
+        cart.add(product.sku, quantity)
+        result = await self._summary(cart)
+        result["content"] = f"Added {quantity} x '{product.name}' to your cart.\n" + result["content"]
+        result["committed"] = True
+        return result
+
+    async def _resolve_product(self, input_text: str, context: Dict[str, Any]):
+        products = await db.get_products()
+        # Strip cart verbs so they don't dilute the name match
+        stripped = re.sub(r"\b(add|put|remove|delete|drop|change|update|set|make|quantity|qty|of|to|from|in|into|my|the|it|this|that|cart|\d+)\b", " ", input_text.lower())
+        product = _match_product_name(stripped, products)
+        if product:
+            return product
+        # "add it to cart" -> product currently being discussed
+        if context.get("last_product_sku"):
+            return next((p for p in products if p.sku == context["last_product_sku"]), None)
+        return None
+
+    async def _summary(self, cart: Cart) -> Dict[str, Any]:
+        if not len(cart):
+            return {"content": "Your cart is empty."}
+        # Resolve every line in one batched lookup
+        priced = await db.get_products_by_skus(cart.skus())
+        response = "Your cart:"
+        total = 0.0
+        product_data = []
+        for line in cart.lines():
+            p = priced.get(line["sku"])
+            if not p:
+                continue
+            total += p.price * line["quantity"]
+            product_data.append(p.dict())
+            response += f"\n- {p.name} x {line['quantity']} (INR {p.price * line['quantity']})"
+        response += f"\nTotal: INR {total}"
+        return {
+            "content": response,
+            "options": ["Checkout"],
+            "products": product_data
+        }
+
 class FulfillmentAgent(Agent):
     async def process(self, input_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
         input_lower = input_text.lower()
@@ -307,6 +471,9 @@ class FulfillmentAgent(Agent):
         if order_match:
             order_id = order_match.group(1).upper()
             return {"content": f"Tracking for {order_id}: Your order is currently 'In Transit' and is expected to arrive within 2 days."}
+
+        if re.search(r"\b(pick ?up|collect)\b", input_lower):
+            return await self._pickup(input_lower, context)
         
         # If no ID found but user wants to track
         if "track" in input_lower or "where" in input_lower or "status" in input_lower:
@@ -314,6 +481,49 @@ class FulfillmentAgent(Agent):
             
         return {"content": "Your order will be shipped to your registered address. Standard delivery is 3-5 business days."}
 
+    async def _pickup(self, input_lower: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        # Store: a pickup location named in the message, else the session's store
+        normalized = input_lower.replace("_", " ")
+        locations = await db.get_locations()
+        pickup_locations = await db.get_pickup_locations()
+        store = next((loc for loc in pickup_locations if loc.lower().replace("_", " ") in normalized), None)
+
+        # Items: the product named in the message, else the cart, else the product being discussed
+        cart = Cart(context)
+        for loc in locations:
+            normalized = normalized.replace(loc.lower().replace("_", " "), " ")
+        stripped = re.sub(r"\b(can|could|i|is|are|it|this|that|the|my|a|an|for|to|at|in|from|pick ?up|collect|available|store|do|you|have|\d+)\b", " ", normalized)
+        product = _match_product_name(stripped, await db.get_products())
+        if product:
+            context["last_product_id"] = product.id
+            context["last_product_name"] = product.name
+            context["last_product_sku"] = product.sku
+            lines = [{"sku": product.sku, "quantity": cart.quantity(product.sku) or 1}]
+        else:
+            lines = cart.lines()
+            if not lines and context.get("last_product_sku"):
+                lines = [{"sku": context["last_product_sku"], "quantity": 1}]
+        if not lines:
+            return {"content": "Which product would you like to pick up? Ask about a product first and I'll check nearby stores."}
+
+        store = store or context.get("store")
+
+        products = await db.get_products_by_skus([l["sku"] for l in lines])
+        response = []
+        for line in lines:
+            name = products[line["sku"]].name if line["sku"] in products else line["sku"]
+            if store and await db.check_pickup(line["sku"], store, line["quantity"]):
+                response.append(f"'{name}' is available for pickup at {store}.")
+                continue
+            alternative = await db.find_pickup_location(line["sku"], line["quantity"], origin=store)
+            if store and alternative:
+                response.append(f"'{name}' is not available at {store}, but you can pick it up at {alternative}.")
+            elif alternative:
+                response.append(f"'{name}' can be picked up at {alternative}.")
+            else:
+                response.append(f"Sorry, '{name}' is not available for pickup right now.")
+        return {"content": "\n".join(response)}
+
 class SalesAgent(Agent):
     def __init__(self):
         super().__init__("SalesAgent")
@@ -321,6 +531,7 @@ class SalesAgent(Agent):
             "recommendation": RecommendationAgent("RecommendationAgent"),
             "inventory": InventoryAgent("InventoryAgent"),
             "payment": PaymentAgent("PaymentAgent"),
+            "cart": CartAgent("CartAgent"),
             "fulfillment": FulfillmentAgent("FulfillmentAgent"),
         }
 
@@ -328,17 +539,22 @@ class SalesAgent(Agent):
         text = input_text.lower()
         
         # Priority 1: Explicit Intent
-        if "stock" in text or "available" in text or "how many" in text:
+        # Pickup first: "is X available for pickup at Y" is a store question, not a stock total
+        if re.search(r"\b(pick ?up|collect)\b", text):
+            return self.workers["fulfillment"]
+        elif "stock" in text or "available" in text or "how many" in text:
             return self.workers["inventory"]
         elif "buy" in text or "pay" in text or "checkout" in text:
             return self.workers["payment"]
+        elif "cart" in text or (context.get("cart") and re.search(r"\b(remove|quantity)\b", text)):
+            return self.workers["cart"]
         elif "ship" in text or "deliver" in text or "track" in text:
             return self.workers["fulfillment"]
             
         # Priority 2: Contextual Intent (Ambiguous inputs like "yes", "how much is it")
         last_agent = context.get("last_agent")
         
-        if last_agent == "PaymentAgent" and ("yes" in text or "no" in text):
+        if last_agent == "PaymentAgent" and ("yes" in text or "no" in text or text.strip() in ("upi", "card")):
             return self.workers["payment"]
             
         if ("it" in text or "that" in text) and context.get("last_product_id"):
@@ -354,12 +570,15 @@ class SalesAgent(Agent):
         worker = self.route(input_text, context)
         context["last_agent"] = worker.name
         
-        response_dict = await worker.process(input_text, context)
+        # One memo per turn: repeated catalog/inventory reads across agents hit the db once
+        with db.turn():
+            response_dict = await worker.process(input_text, context)
         # Ensure it's a dict (in case a worker was missed, though we updated all)
         if isinstance(response_dict, str):
             response_dict = {"content": response_dict}
             
         response_dict["agent_name"] = worker.name
+        query_analytics.record(input_text, worker.name, response_dict)
         
         # Optional: prepend agent name if desired, but user wanted clean output.
         # We can stick it in front if it's just content
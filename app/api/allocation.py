@@ -0,0 +1,185 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+class AllocationEngine:
+    """
+    Location-aware stock allocation over the sku -> location -> qty inventory.
+
+    Keeps per-SKU quantity heaps plus a location -> in-stock SKUs index, so that:
+      - "is SKU available at store X" is a dict lookup,
+      - an order is assigned to as few fulfillment locations as possible,
+        preferring the order's origin store, then higher-priority (or closer)
+        locations on ties,
+      - pickup suggestions only name locations customers can visit.
+    All inventory writes must go through `set_quantity` / `commit` to keep the
+    indexes in sync. Heaps use lazy deletion: stale entries are skipped on read.
+    """
+    def __init__(self, inventory: Dict[str, Dict[str, int]],
+                 location_priority: Optional[Dict[str, float]] = None,
+                 distances: Optional[Dict[str, Dict[str, float]]] = None,
+                 pickup_locations: Optional[Set[str]] = None):
+        self._inventory = inventory
+        # Lower value = preferred. Unlisted locations rank last.
+        self.location_priority = location_priority or {}
+        # origin -> location -> distance; used instead of priority when an origin is given
+        self.distances = distances or {}
+        # Locations open to customers for pickup (stores, not warehouses); None means all
+        self.pickup_locations = pickup_locations
+        self._by_qty: Dict[str, List[Tuple[int, str]]] = {}
+        self._stock_at: Dict[str, Set[str]] = {}
+        self._assortment: Dict[str, Set[str]] = {}  # location -> SKUs it carries (any qty)
+        self._totals: Dict[str, int] = {}
+        # Per-location change counters, so per-store caches can tell when they are stale
+        self.stock_versions: Dict[str, int] = {}
+        self.assortment_versions: Dict[str, int] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        self._by_qty.clear()
+        self._stock_at.clear()
+        self._assortment.clear()
+        self._totals.clear()
+        for sku, locations in self._inventory.items():
+            self._totals[sku] = sum(locations.values())
+            for loc, qty in locations.items():
+                self._stock_at.setdefault(loc, set())
+                self._assortment.setdefault(loc, set()).add(sku)
+                self.stock_versions[loc] = self.stock_versions.get(loc, 0) + 1
+                self.assortment_versions[loc] = self.assortment_versions.get(loc, 0) + 1
+                if qty > 0:
+                    self._index(sku, loc, qty)
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def total(self, sku: str) -> int:
+        return self._totals.get(sku, 0)
+
+    def locations(self) -> List[str]:
+        return list(self._stock_at.keys())
+
+    def stock_at(self, location: str) -> Dict[str, int]:
+        return {sku: self._inventory[sku][location] for sku in self._assortment.get(location, ())}
+
+    def is_available_at(self, location: str, sku: str, quantity: int = 1) -> bool:
+        return self._inventory.get(sku, {}).get(location, 0) >= quantity
+
+    def locations_for_pickup(self) -> List[str]:
+        return [loc for loc in self._stock_at if self.pickup_locations is None or loc in self.pickup_locations]
+
+    def best_pickup_location(self, sku: str, quantity: int = 1, origin: Optional[str] = None) -> Optional[str]:
+        """Pickup location holding `quantity` units of `sku`: `origin` itself, else the nearest / preferred one."""
+        candidates = [loc for loc in self._locations_with(sku, quantity)
+                      if self.pickup_locations is None or loc in self.pickup_locations]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda loc: (self._rank(loc, origin), loc))
+
+    # -------------------------
+    # Planning
+    # -------------------------
+    def plan(self, demand: Dict[str, int], origin: Optional[str] = None) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Choose locations for a whole order: {sku: [(location, qty), ...]}.
+        Greedy set cover: repeatedly take the location that can fully ship the
+        most remaining lines, then split whatever no single location covers,
+        preferring locations already in the plan. Raises ValueError if the
+        order cannot be filled. Does not modify inventory.
+        """
+        remaining = {sku: qty for sku, qty in demand.items() if qty > 0}
+        plan: Dict[str, List[Tuple[str, int]]] = {sku: [] for sku in remaining}
+
+        cover: Dict[str, Set[str]] = {}
+        for sku, need in remaining.items():
+            for loc in self._locations_with(sku, need):
+                cover.setdefault(loc, set()).add(sku)
+
+        used: List[str] = []
+        while remaining and cover:
+            best = max(cover, key=lambda loc: (len(cover[loc]), -self._rank(loc, origin), loc))
+            skus = cover.pop(best)
+            if not skus:
+                break
+            used.append(best)
+            for sku in skus:
+                plan[sku].append((best, remaining.pop(sku)))
+            for loc in cover:
+                cover[loc] -= skus
+
+        # Lines no single location can fill: split, reusing chosen locations first
+        for sku, need in remaining.items():
+            stock = self._inventory.get(sku, {})
+            candidates = sorted(
+                (loc for loc, qty in stock.items() if qty > 0),
+                key=lambda loc: (loc not in used, -stock[loc], self._rank(loc, origin), loc)
+            )
+            for loc in candidates:
+                take = min(need, stock[loc])
+                plan[sku].append((loc, take))
+                if loc not in used:
+                    used.append(loc)
+                need -= take
+                if need == 0:
+                    break
+            if need > 0:
+                raise ValueError(f"Insufficient stock for {sku}: short by {need}")
+        return plan
+
+    def commit(self, plan: Dict[str, List[Tuple[str, int]]]):
+        for sku, picks in plan.items():
+            for loc, qty in picks:
+                self.set_quantity(sku, loc, self._inventory[sku].get(loc, 0) - qty)
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    def set_quantity(self, sku: str, location: str, quantity: int):
+        locations = self._inventory.setdefault(sku, {})
+        self._totals[sku] = self._totals.get(sku, 0) - locations.get(location, 0) + quantity
+        locations[location] = quantity
+        self._stock_at.setdefault(location, set())
+        self.stock_versions[location] = self.stock_versions.get(location, 0) + 1
+        if sku not in self._assortment.setdefault(location, set()):
+            self._assortment[location].add(sku)
+            self.assortment_versions[location] = self.assortment_versions.get(location, 0) + 1
+        if quantity > 0:
+            self._index(sku, location, quantity)
+        else:
+            self._stock_at[location].discard(sku)
+        # Compact heaps once stale entries dominate
+        if len(self._by_qty.get(sku, ())) > 2 * len(locations) + 8:
+            self._by_qty[sku] = [(-q, l) for l, q in locations.items() if q > 0]
+            heapq.heapify(self._by_qty[sku])
+
+    # -------------------------
+    # Internals
+    # -------------------------
+    def _index(self, sku: str, location: str, quantity: int):
+        self._stock_at.setdefault(location, set()).add(sku)
+        heapq.heappush(self._by_qty.setdefault(sku, []), (-quantity, location))
+
+    def _rank(self, location: str, origin: Optional[str]) -> float:
+        # The origin store itself always comes first, with or without a distance table
+        if origin is not None and location == origin:
+            return float("-inf")
+        if origin is not None and origin in self.distances:
+            return self.distances[origin].get(location, float("inf"))
+        return self.location_priority.get(location, float("inf"))
+
+    def _locations_with(self, sku: str, need: int) -> List[str]:
+        """Locations holding at least `need` units, read off the quantity heap."""
+        heap = self._by_qty.get(sku)
+        if not heap:
+            return []
+        stock = self._inventory[sku]
+        found, popped, seen = [], [], set()
+        while heap and -heap[0][0] >= need:
+            neg_qty, loc = heapq.heappop(heap)
+            if stock.get(loc, 0) != -neg_qty or loc in seen:
+                continue  # stale entry, drop it
+            seen.add(loc)
+            popped.append((neg_qty, loc))
+            found.append(loc)
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return found
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import time
+import asyncio
+from typing import Dict, Any, List, Tuple
+from .privacy import anonymize
+
+# Number of distinct queries tracked by each heavy-hitter table
+ANALYTICS_TOP_K = int(os.getenv("ANALYTICS_TOP_K", "200"))
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+# Seconds between snapshots to disk (0 disables the background task)
+ANALYTICS_SNAPSHOT_INTERVAL = float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "300"))
+
+_WS_RE = re.compile(r"\s+")
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter counter: tracks at most `capacity` items.
+    When full, a new item replaces the current minimum and inherits its count
+    as the error bound, so counts are over-estimates by at most `error`.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: Dict[str, List[int]] = {}  # item -> [count, error]
+
+    def add(self, item: str, n: int = 1):
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += n
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[item] = [n, 0]
+            return
+        victim = min(self._counts, key=lambda k: self._counts[k][0])
+        floor = self._counts.pop(victim)[0]
+        self._counts[item] = [floor + n, floor]
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        ranked = sorted(self._counts.items(), key=lambda kv: kv[1][0], reverse=True)
+        return [(item, count, error) for item, (count, error) in ranked[:k]]
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        return {item: list(v) for item, v in self._counts.items()}
+
+    def load(self, data: Dict[str, List[int]]):
+        ranked = sorted(data.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+        self._counts = {item: [int(c), int(e)] for item, (c, e) in ranked}
+
+class QueryAnalytics:
+    """
+    Fixed-memory streaming stats over chat turns: heavy-hitter queries,
+    zero-result queries, per-agent routing mix and clarification rate.
+    `record` is O(1) except when a heavy-hitter table evicts (O(capacity)).
+    """
+    def __init__(self, capacity: int = ANALYTICS_TOP_K, directory: str = ANALYTICS_DIR):
+        self.directory = directory
+        self.started = time.time()
+        self.turns = 0
+        self.zero_results = 0
+        self.clarifications = 0
+        self.agents: Dict[str, int] = {}
+        self.queries = SpaceSaving(capacity)
+        self.zero_result_queries = SpaceSaving(capacity)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # Scrub emails, phone numbers and order ids before anything is counted, saved or served
+        return _WS_RE.sub(" ", anonymize(query).strip().lower())[:100]
+
+    def record(self, query: str, agent_name: str, response: Dict[str, Any]):
+        q = self.normalize(query)
+        self.turns += 1
+        self.agents[agent_name] = self.agents.get(agent_name, 0) + 1
+        self.queries.add(q)
+        if response.get("clarification"):
+            self.clarifications += 1
+        elif agent_name == "RecommendationAgent" and not response.get("products"):
+            self.zero_results += 1
+            self.zero_result_queries.add(q)
+
+    def top_queries(self, k: int = 50) -> List[str]:
+        return [item for item, _, _ in self.queries.top(k)]
+
+    def snapshot(self, k: int = 20) -> Dict[str, Any]:
+        turns = self.turns or 1
+        return {
+            "since": self.started,
+            "turns": self.turns,
+            "agentMix": {name: count / turns for name, count in self.agents.items()},
+            "agentCounts": dict(self.agents),
+            "zeroResultRate": self.zero_results / turns,
+            "clarificationRate": self.clarifications / turns,
+            "topQueries": [{"query": q, "count": c, "error": e} for q, c, e in self.queries.top(k)],
+            "topZeroResultQueries": [{"query": q, "count": c, "error": e} for q, c, e in self.zero_result_queries.top(k)],
+        }
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, "query_analytics.json")
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        state = {
+            "since": self.started,
+            "turns": self.turns,
+            "zeroResults": self.zero_results,
+            "clarifications": self.clarifications,
+            "agents": self.agents,
+            "queries": self.queries.to_dict(),
+            "zeroResultQueries": self.zero_result_queries.to_dict(),
+        }
+        # Write-then-rename so a crash never leaves a half-written snapshot
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.started = state.get("since", self.started)
+        self.turns = state.get("turns", 0)
+        self.zero_results = state.get("zeroResults", 0)
+        self.clarifications = state.get("clarifications", 0)
+        self.agents = state.get("agents", {})
+        self.queries.load(self._scrubbed(state.get("queries", {})))
+        self.zero_result_queries.load(self._scrubbed(state.get("zeroResultQueries", {})))
+        return True
+
+    def _scrubbed(self, data: Dict[str, List[int]]) -> Dict[str, List[int]]:
+        # Snapshots written before queries were anonymized may hold raw text; merge what collides
+        merged: Dict[str, List[int]] = {}
+        for item, (count, error) in data.items():
+            entry = merged.setdefault(self.normalize(item), [0, 0])
+            entry[0] += count
+            entry[1] += error
+        return merged
+
+    async def run_snapshots(self, interval: float = ANALYTICS_SNAPSHOT_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Analytics snapshot failed: {e}")
+
+query_analytics = QueryAnalytics()
@@ -0,0 +1,42 @@
+from typing import List, Dict, Any
+
+class Cart:
+    """
+    Per-session shopping cart.
+    State lives in the session context as {"cart": {sku: quantity}} so it
+    survives across turns on the same websocket connection.
+    """
+    def __init__(self, context: Dict[str, Any]):
+        if not isinstance(context.get("cart"), dict):
+            context["cart"] = {}
+        self._items: Dict[str, int] = context["cart"]
+
+    def add(self, sku: str, quantity: int = 1) -> int:
+        self._items[sku] = self._items.get(sku, 0) + max(quantity, 1)
+        return self._items[sku]
+
+    def remove(self, sku: str) -> bool:
+        return self._items.pop(sku, None) is not None
+
+    def set_quantity(self, sku: str, quantity: int):
+        # Setting a quantity of zero (or less) removes the line
+        if quantity <= 0:
+            self._items.pop(sku, None)
+        else:
+            self._items[sku] = quantity
+
+    def clear(self):
+        self._items.clear()
+
+    def quantity(self, sku: str) -> int:
+        return self._items.get(sku, 0)
+
+    def lines(self) -> List[Dict[str, Any]]:
+        """Cart contents in the shape expected by db.create_order."""
+        return [{"sku": sku, "quantity": qty} for sku, qty in self._items.items()]
+
+    def skus(self) -> List[str]:
+        return list(self._items.keys())
+
+    def __len__(self) -> int:
+        return sum(self._items.values())
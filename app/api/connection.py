@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import asyncio
+from typing import Dict, Any, Optional
+from .profiling import turn_profiler
+from .recorder import session_recorder
+
+# Server-wide cap on turns being processed/streamed at once; beyond this we shed load
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "200"))
+# Per-connection cap on messages waiting behind the in-flight one
+MAX_PENDING_MESSAGES = int(os.getenv("MAX_PENDING_MESSAGES", "4"))
+
+BUSY_MESSAGE = "We're experiencing high demand right now. Please try again in a moment."
+
+class TurnAdmission:
+    """Non-blocking counter of in-flight turns across all connections."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.shed = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+turn_admission = TurnAdmission(MAX_CONCURRENT_TURNS)
+
+class ChatConnection:
+    """
+    Runs one /ws/chat connection as a reader task and a writer task joined by a
+    bounded inbound queue. A newer user message supersedes the one being answered:
+    its stream is cancelled and a `cancelled` frame is sent. Agents always finish,
+    and replies flagged `committed` (cart edits, placed orders) are always delivered.
+    Messages superseded before they started get `cancelled` with `started: false`;
+    when the queue is full the oldest waiting message is the one dropped.
+    """
+    def __init__(self, websocket, sales_agent, stock_subscriber=None,
+                 admission: TurnAdmission = turn_admission,
+                 max_pending: int = MAX_PENDING_MESSAGES,
+                 chunk_size: int = 5, chunk_delay: float = 0.05):
+        self.websocket = websocket
+        self.sales_agent = sales_agent
+        self.stock_subscriber = stock_subscriber
+        self.admission = admission
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.session_context: Dict[str, Any] = {}  # Persistent context for this connection
+        self.inbound: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._current: Optional[asyncio.Task] = None
+        self.recording = session_recorder.start()  # None unless RECORD_SESSIONS_DIR is set
+
+    async def run(self):
+        writer = asyncio.create_task(self._writer())
+        try:
+            await self._reader()
+        finally:
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            if self.recording:
+                await session_recorder.finish(self.recording)
+
+    async def _reader(self):
+        while True:
+            data = await self.websocket.receive_text()
+            print(f"Received data: {data}")
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                print("Ignoring malformed message")
+                continue
+
+            if payload.get("type") != "user_message":
+                continue
+
+            if self.recording:
+                payload["_turn"] = self.recording.message(payload.get("data", {}))
+                payload["_received"] = time.monotonic()
+
+            # Newest message wins: stop answering the previous one
+            if self._current and not self._current.done():
+                self._current.cancel()
+
+            try:
+                self.inbound.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Still newest-wins: drop the oldest waiting message, never the one just sent
+                self.inbound.get_nowait()
+                await self.websocket.send_json({"type": "cancelled", "started": False})
+                self.inbound.put_nowait(payload)
+
+    async def _writer(self):
+        while True:
+            payload = await self.inbound.get()
+            if not self.inbound.empty():
+                # Already superseded by a message queued behind it
+                await self.websocket.send_json({"type": "cancelled", "started": False})
+                continue
+
+            turn = asyncio.create_task(self._handle(payload))
+            self._current = turn
+            try:
+                await asyncio.wait({turn})
+            except asyncio.CancelledError:
+                turn.cancel()
+                raise
+            finally:
+                self._current = None
+
+            if turn.cancelled():
+                await self.websocket.send_json({"type": "cancelled"})
+
+    async def _handle(self, payload: Dict[str, Any]):
+        if not self.admission.try_acquire():
+            await self.websocket.send_json({
+                "type": "final",
+                "content": BUSY_MESSAGE,
+                "options": [],
+                "products": [],
+                "product_context": None,
+                "agentName": None
+            })
+            return
+        try:
+            await self._respond(payload)
+        finally:
+            self.admission.release()
+
+    async def _respond(self, payload: Dict[str, Any]):
+        # The agent always runs to completion, even if a newer message supersedes this
+        # turn meanwhile: a cart edit or order must never be torn halfway. Only the
+        # reply is cancelled, and not even that once the agent reports a write.
+        work = asyncio.ensure_future(self._process(payload))
+        superseded = False
+        while not work.done():
+            try:
+                await asyncio.shield(work)
+            except asyncio.CancelledError:
+                superseded = True
+        response_payload = work.result()
+        committed = response_payload.get("committed", False)
+        if superseded and not committed:
+            raise asyncio.CancelledError()
+
+        response_text = response_payload.get("content", "")
+        options = response_payload.get("options", [])
+
+        # Mock streaming effect
+        try:
+            for i in range(0, len(response_text), self.chunk_size):
+                chunk = response_text[i:i+self.chunk_size]
+                await self.websocket.send_json({
+                    "type": "partial",
+                    "chunk": chunk
+                })
+                await asyncio.sleep(self.chunk_delay)
+        except asyncio.CancelledError:
+            if not committed:
+                raise
+            # The shopper must see the outcome of a write (e.g. their order id): skip to the final frame
+
+        # Send final message
+        await self.websocket.send_json({
+            "type": "final",
+            "content": response_text,
+            "options": options,
+            "products": response_payload.get("products", []),
+            "product_context": response_payload.get("product_context"),
+            "agentName": response_payload.get("agent_name")
+        })
+        if self.stock_subscriber:
+            self.stock_subscriber.watch_response(response_payload, self.session_context)
+        if self.recording and "_turn" in payload:
+            self.recording.response(payload["_turn"], response_payload, payload["_received"])
+
+    async def _process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        user_content = payload["data"]["content"]
+        print(f"Processing message: {user_content}")
+
+        # Sampled or debug-flagged turns only; None otherwise (strips the flag from data)
+        profile = turn_profiler.start(payload.get("data", {}))
+
+        # Merge incoming data into persistent context
+        self.session_context.update(payload.get("data", {}))
+
+        response_payload = {}
+        try:
+            # In a real LLM setting, this would be streaming tokens
+            try:
+                response_payload = await self.sales_agent.process(user_content, self.session_context)
+            finally:
+                if profile:
+                    await turn_profiler.finish(profile, response_payload)
+            print(f"Generated response: {response_payload}")
+        except Exception as proc_error:
+            print(f"Error processing message: {proc_error}")
+            import traceback
+            traceback.print_exc()
+            response_payload = {"content": "I encountered an error processing your request."}
+        return response_payload
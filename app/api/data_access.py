@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from .services import db as _db
+
+# Reads that are safe to share between callers; everything else is treated as a write
+READ_METHODS = {
+    "get_products",
+    "get_products_by_skus",
+    "check_inventory",
+    "get_locations",
+    "get_pickup_locations",
+    "check_pickup",
+    "find_pickup_location",
+    "get_location_versions",
+    "get_location_stock",
+    "get_location_catalog",
+}
+
+_turn_memo: ContextVar[Optional[Dict[Tuple, Any]]] = ContextVar("turn_memo", default=None)
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_freeze(v) for v in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort(key=repr)
+        return tuple(items)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+class DataAccess:
+    """
+    Layer between the agents and the `db` service.
+
+    - Single-flight: identical reads already in flight (from any session) are
+      awaited instead of issued again.
+    - Per-turn memoization: inside `with data.turn():` each distinct read runs at
+      most once; any write clears the memo so later reads in the turn see it.
+    Results are shared between callers and must be treated as read-only.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.calls = 0
+        self.memo_hits = 0
+        self.coalesced = 0
+        self.backend_calls = 0
+
+    @contextmanager
+    def turn(self):
+        token = _turn_memo.set({})
+        try:
+            yield
+        finally:
+            _turn_memo.reset(token)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "memoHits": self.memo_hits,
+            "coalesced": self.coalesced,
+            "backendCalls": self.backend_calls,
+            "inFlight": len(self._inflight),
+        }
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._backend, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        if name in READ_METHODS:
+            async def read(*args, **kwargs):
+                return await self._read(name, attr, args, kwargs)
+            return read
+
+        async def write(*args, **kwargs):
+            memo = _turn_memo.get()
+            if memo:
+                memo.clear()
+            return await attr(*args, **kwargs)
+        return write
+
+    async def _read(self, name: str, method, args, kwargs):
+        self.calls += 1
+        key = (name, _freeze(args), _freeze(kwargs))
+        memo = _turn_memo.get()
+        if memo is not None and key in memo:
+            self.memo_hits += 1
+            return memo[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.backend_calls += 1
+            task = asyncio.ensure_future(method(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, key=key: self._inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the shared call
+        result = await asyncio.shield(task)
+        if memo is not None:
+            memo[key] = result
+        return result
+
+# Drop-in replacement for services.db used by the agents
+db = DataAccess(_db)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Set, Optional, Callable, Awaitable, Any
+
+class StockSubscriber:
+    """
+    One per websocket connection.
+    Collects stock changes for the SKUs the shopper has recently seen and flushes
+    them as coalesced `stock_update` frames, at most one every `min_interval` seconds.
+    """
+    def __init__(self, bus: "StockEventBus", send: Callable[[Dict[str, Any]], Awaitable[None]],
+                 max_skus: int = 20, min_interval: float = 1.0):
+        self._bus = bus
+        self._send = send
+        self._max_skus = max_skus
+        self._min_interval = min_interval
+        self._seen: "OrderedDict[str, None]" = OrderedDict()  # LRU of watched SKUs
+        self._pending: Dict[str, int] = {}  # sku -> latest total qty (older values are overwritten)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        self._bus.unsubscribe_all(self)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def watch(self, sku: str):
+        if not sku:
+            return
+        if sku in self._seen:
+            self._seen.move_to_end(sku)
+            return
+        self._seen[sku] = None
+        self._bus.subscribe(sku, self)
+        # Only keep the most recently seen SKUs subscribed
+        while len(self._seen) > self._max_skus:
+            old_sku, _ = self._seen.popitem(last=False)
+            self._bus.unsubscribe(old_sku, self)
+            self._pending.pop(old_sku, None)
+
+    def watch_response(self, response: Dict[str, Any], context: Dict[str, Any]):
+        """Subscribe to everything a reply put in front of the shopper."""
+        for p in response.get("products") or []:
+            self.watch(p.get("sku"))
+        product_context = response.get("product_context")
+        if product_context:
+            self.watch(product_context.get("sku"))
+        self.watch(context.get("last_product_sku"))
+
+    def notify(self, sku: str, quantity: int):
+        self._pending[sku] = quantity
+        self._wakeup.set()
+
+    async def _flush_loop(self):
+        last_sent = 0.0
+        while True:
+            await self._wakeup.wait()
+            # Rate limit: changes arriving inside the window are coalesced into one frame
+            wait = self._min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._wakeup.clear()
+            updates, self._pending = self._pending, {}
+            if not updates:
+                continue
+            try:
+                await self._send({
+                    "type": "stock_update",
+                    "updates": [
+                        {"sku": sku, "quantity": qty, "inStock": qty > 0}
+                        for sku, qty in updates.items()
+                    ]
+                })
+            except Exception as e:
+                print(f"Stock update send failed: {e}")
+                return
+            last_sent = time.monotonic()
+
+class StockEventBus:
+    """
+    In-process pub/sub for per-SKU stock changes.
+    Subscribers are indexed by SKU so a publish only touches the connections
+    watching that SKU, not every open socket.
+    """
+    def __init__(self):
+        self._subscribers: Dict[str, Set[StockSubscriber]] = {}
+
+    def subscribe(self, sku: str, subscriber: StockSubscriber):
+        self._subscribers.setdefault(sku, set()).add(subscriber)
+
+    def unsubscribe(self, sku: str, subscriber: StockSubscriber):
+        subs = self._subscribers.get(sku)
+        if subs is not None:
+            subs.discard(subscriber)
+            if not subs:
+                del self._subscribers[sku]
+
+    def unsubscribe_all(self, subscriber: StockSubscriber):
+        for sku in list(subscriber._seen):
+            self.unsubscribe(sku, subscriber)
+        subscriber._seen.clear()
+
+    def publish(self, sku: str, quantity: int):
+        for subscriber in self._subscribers.get(sku, ()):
+            subscriber.notify(sku, quantity)
+
+class OrderEventBus:
+    """
+    Synchronous in-process notifications for placed orders.
+    Handlers run inline after the order is committed, so they must be cheap;
+    a failing handler is logged and never fails the order.
+    """
+    def __init__(self):
+        self._handlers: List[Callable[[Dict[str, Any]], None]] = []
+
+    def subscribe(self, handler: Callable[[Dict[str, Any]], None]):
+        self._handlers.append(handler)
+
+    def publish(self, order: Dict[str, Any]):
+        for handler in self._handlers:
+            try:
+                handler(order)
+            except Exception as e:
+                print(f"Order event handler failed: {e}")
+
+class CatalogEventBus(OrderEventBus):
+    """Synchronous in-process notifications for added or edited catalog products; same rules as orders."""
+
+# Shared buses used by services (publishers) and the websocket endpoint / profiles (subscribers)
+stock_events = StockEventBus()
+order_events = OrderEventBus()
+catalog_events = CatalogEventBus()
@@ -1,11 +1,17 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from .models import ChatRequest, Message
+from .models import ChatRequest, Message, BulkOrderRequest
 from .agents import SalesAgent
 from .services import db
-import json
-import asyncio
+from .events import stock_events, StockSubscriber
+from .connection import ChatConnection, turn_admission
+from .analytics import query_analytics, ANALYTICS_SNAPSHOT_INTERVAL
+from .search import catalog_index
+from .data_access import db as data_access
+from .partitions import partitions
+from .profiles import profile_store
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -15,8 +21,31 @@ async def lifespan(app: FastAPI):
         print("Database connected.")
     except Exception as e:
         print(f"Database connection failed: {e}")
+
+    # Restore query stats and pre-warm search caches with the most popular queries;
+    # the index re-warms itself the same way whenever the catalog changes
+    if query_analytics.load():
+        print(f"Loaded query analytics ({query_analytics.turns} turns).")
+    catalog_index.warm_queries = lambda: query_analytics.top_queries(50)
+    try:
+        catalog_index.ensure(await db.get_products(), db.catalog_version)
+    except Exception as e:
+        print(f"Search index warm-up failed: {e}")
+    # Affinity profiles from order history; kept current afterwards by order events
+    try:
+        profile_store.build(await db.get_order_lines())
+        print(f"Built {len(profile_store.profiles)} user profiles.")
+    except Exception as e:
+        print(f"Profile build failed: {e}")
+    snapshot_task = asyncio.create_task(query_analytics.run_snapshots()) if ANALYTICS_SNAPSHOT_INTERVAL > 0 else None
     yield
     # Shutdown
+    if snapshot_task:
+        snapshot_task.cancel()
+    try:
+        query_analytics.save()
+    except Exception as e:
+        print(f"Analytics snapshot failed: {e}")
     await db.disconnect()
 
 # Initialize with lifespan
@@ -35,60 +64,41 @@ sales_agent = SalesAgent()
 
 @app.get("/api/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "inFlightTurns": turn_admission.in_flight, "shedTurns": turn_admission.shed, "dataAccess": data_access.stats(), "partitions": partitions.stats()}
+
+@app.get("/api/analytics")
+def analytics(top: int = 20):
+    return query_analytics.snapshot(top)
+
+@app.post("/api/orders/bulk")
+async def create_orders_bulk(request: BulkOrderRequest):
+    # B2B / kiosk batches: one resolve + stock check pass for the whole batch
+    try:
+        order_ids = await db.create_orders_bulk([
+            {
+                "user_id": o.userId,
+                "items": [{"sku": i.sku, "quantity": i.quantity} for i in o.items],
+                "total": o.total,
+                "origin": o.origin,
+            }
+            for o in request.orders
+        ])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"order_ids": order_ids}
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    session_context = {}  # Persistent context for this connection
+    # Pushes coalesced stock changes for products this shopper has seen
+    stock_subscriber = StockSubscriber(stock_events, websocket.send_json)
+    stock_subscriber.start()
+    connection = ChatConnection(websocket, sales_agent, stock_subscriber)
     try:
-        while True:
-            data = await websocket.receive_text()
-            print(f"Received data: {data}")
-            payload = json.loads(data)
-            
-            if payload.get("type") == "user_message":
-                user_content = payload["data"]["content"]
-                print(f"Processing message: {user_content}")
-                
-                # Merge incoming data into persistent context
-                session_context.update(payload.get("data", {}))
-                
-                try:
-                    # In a real LLM setting, this would be streaming tokens
-                    response_payload = await sales_agent.process(user_content, session_context)
-                    print(f"Generated response: {response_payload}")
-
-                    response_text = response_payload.get("content", "")
-                    options = response_payload.get("options", [])
-                except Exception as proc_error:
-                    print(f"Error processing message: {proc_error}")
-                    import traceback
-                    traceback.print_exc()
-                    response_text = "I encountered an error processing your request."
-                    options = []
-                
-                # Mock streaming effect
-                chunk_size = 5
-                for i in range(0, len(response_text), chunk_size):
-                    chunk = response_text[i:i+chunk_size]
-                    await websocket.send_json({
-                        "type": "partial",
-                        "chunk": chunk
-                    })
-                    await asyncio.sleep(0.05)
-                
-                # Send final message
-                await websocket.send_json({
-                    "type": "final",
-                    "content": response_text,
-                    "options": options,
-                    "products": response_payload.get("products", []),
-                    "product_context": response_payload.get("product_context"),
-                    "agentName": response_payload.get("agent_name")
-                })
-                
+        await connection.run()
     except WebSocketDisconnect:
         print("Client disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
+    finally:
+        await stock_subscriber.close()
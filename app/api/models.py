@@ -25,3 +25,16 @@ class Order(BaseModel):
     items: List[Product]
     total: float
     status: str
+
+class OrderItemRequest(BaseModel):
+    sku: str
+    quantity: int = 1
+
+class OrderRequest(BaseModel):
+    userId: str
+    items: List[OrderItemRequest]
+    total: Optional[float] = None  # optional cross-check; rejected if it differs from catalog prices
+    origin: Optional[str] = None  # store the order is placed from, for nearest-location allocation
+
+class BulkOrderRequest(BaseModel):
+    orders: List[OrderRequest]
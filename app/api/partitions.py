@@ -0,0 +1,82 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+from .models import Product
+from .search import CatalogSearchIndex
+from .data_access import db
+
+# Partitions untouched for this long are dropped
+PARTITION_IDLE_SECONDS = float(os.getenv("PARTITION_IDLE_SECONDS", "600"))
+# Upper bound on partitions held in memory at once (least recently used goes first)
+PARTITION_MAX = int(os.getenv("PARTITION_MAX", "32"))
+
+class CatalogPartition:
+    """One location's slice of the catalog: its product subset, shelf stock and search index."""
+    def __init__(self, location: str, products: List[Product], stock: Dict[str, int], versions: Dict[str, int]):
+        self.location = location
+        self.products = products
+        self.stock = stock
+        self.versions = versions
+        self.index = CatalogSearchIndex().ensure(products, versions["assortment"])
+        self.last_used = time.monotonic()
+
+    def update_stock(self, stock: Dict[str, int], versions: Dict[str, int]):
+        # Assortment unchanged: refresh quantities and inStock flags, keep the search index
+        self.stock = stock
+        self.products = [p.copy(update={"inStock": stock.get(p.sku, 0) > 0}) for p in self.products]
+        self.versions = versions
+
+class PartitionManager:
+    """
+    Lazily loaded, idle-evicted per-location catalog partitions.
+    A session whose context names a `store` is served from that store's
+    partition, so memory and query cost follow the stores that are in use
+    rather than the whole chain.
+    """
+    def __init__(self, idle_seconds: float = PARTITION_IDLE_SECONDS, max_partitions: int = PARTITION_MAX):
+        self.idle_seconds = idle_seconds
+        self.max_partitions = max_partitions
+        self._partitions: "OrderedDict[str, CatalogPartition]" = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    async def get(self, location: str) -> Optional[CatalogPartition]:
+        self._evict_idle()
+        versions = await db.get_location_versions(location)
+        if not versions["assortment"]:
+            return None  # unknown location: caller falls back to the global catalog
+
+        partition = self._partitions.get(location)
+        if (partition is None
+                or partition.versions["catalog"] != versions["catalog"]
+                or partition.versions["assortment"] != versions["assortment"]):
+            products = await db.get_location_catalog(location)
+            stock = await db.get_location_stock(location)
+            partition = CatalogPartition(location, products, stock, versions)
+            self._partitions[location] = partition
+            self.loads += 1
+            while len(self._partitions) > self.max_partitions:
+                self._partitions.popitem(last=False)
+                self.evictions += 1
+        elif partition.versions["stock"] != versions["stock"]:
+            partition.update_stock(await db.get_location_stock(location), versions)
+
+        partition.last_used = time.monotonic()
+        self._partitions.move_to_end(location)
+        return partition
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        # OrderedDict is in last-used order, so idle partitions are at the front
+        while self._partitions:
+            location, partition = next(iter(self._partitions.items()))
+            if partition.last_used >= cutoff:
+                break
+            del self._partitions[location]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": list(self._partitions.keys()), "loads": self.loads, "evictions": self.evictions}
+
+partitions = PartitionManager()
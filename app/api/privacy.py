@@ -0,0 +1,13 @@
+import re
+
+# Personal data that must not leave the process verbatim (recordings, analytics snapshots)
+_SCRUBBERS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\+?\d[\d\s-]{8,}\d"), "<number>"),
+    (re.compile(r"\b(ord-[a-z0-9]+)\b", re.IGNORECASE), "ORD-XXXXXX"),
+]
+
+def anonymize(text: str) -> str:
+    for pattern, replacement in _SCRUBBERS:
+        text = pattern.sub(replacement, text)
+    return text
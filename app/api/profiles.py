@@ -0,0 +1,99 @@
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple, Iterable
+from .events import order_events, catalog_events
+
+# Upper bounds (INR) of the price bands used as affinity features
+PRICE_BANDS = [1000, 2500, 5000]
+# How many recent purchases are remembered per user
+RECENT_SKUS = 10
+# Already-bought SKUs are pushed down a little so the list favours similar, new items
+RECENT_PENALTY = 0.5
+# Orders placed without a userId are filed under this id; it is shared, so it never gets a profile
+ANONYMOUS_USER_ID = "guest"
+
+def price_band(price: float) -> str:
+    for upper in PRICE_BANDS:
+        if price < upper:
+            return f"<{upper}"
+    return f">={PRICE_BANDS[-1]}"
+
+def _features(category: str, gender: Optional[str], price: float) -> Tuple[str, str, str]:
+    return (f"cat:{category}", f"gender:{gender or 'Any'}", f"price:{price_band(price)}")
+
+class UserProfile:
+    """Compact affinity vector: feature -> share of purchased units, plus recent SKUs."""
+    __slots__ = ("counts", "units", "weights", "recent")
+
+    def __init__(self):
+        self.counts: Dict[str, float] = {}
+        self.units = 0.0
+        self.weights: Dict[str, float] = {}
+        self.recent = deque(maxlen=RECENT_SKUS)
+
+    def add(self, sku: str, features: Iterable[str], quantity: int):
+        for f in features:
+            self.counts[f] = self.counts.get(f, 0.0) + quantity
+        self.units += quantity
+        if sku in self.recent:
+            self.recent.remove(sku)
+        self.recent.append(sku)
+        # Normalise once per purchase so ranking does no division
+        self.weights = {f: c / self.units for f, c in self.counts.items()}
+
+class ProfileStore:
+    """
+    Per-user affinity profiles over category, gender and price band.
+    Built offline from order history (`build`) and kept current from
+    order events; catalog events drop stale product features. `rerank` is a
+    single pass of dict lookups over the candidate list, so personalization
+    adds only microseconds per turn.
+    """
+    def __init__(self):
+        self.profiles: Dict[str, UserProfile] = {}
+        self._product_features: Dict[str, Tuple[str, str, str]] = {}
+
+    def build(self, lines: List[Dict[str, Any]]):
+        """Rebuild every profile from flattened order lines (see db.get_order_lines)."""
+        self.profiles = {}
+        for line in lines:
+            self._add_line(line["userId"], line)
+
+    def on_order(self, order: Dict[str, Any]):
+        for line in order.get("lines", []):
+            self._add_line(order.get("userId"), line)
+
+    def _add_line(self, user_id: Optional[str], line: Dict[str, Any]):
+        if not user_id or user_id == ANONYMOUS_USER_ID:
+            return
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = UserProfile()
+        profile.add(line["sku"], _features(line["category"], line.get("gender"), line["price"]), line.get("quantity", 1))
+
+    def rerank(self, user_id: Optional[str], products: List[Any]) -> List[Any]:
+        """Stable re-order of `products` by the user's affinity; unchanged for unknown users."""
+        profile = self.profiles.get(user_id) if user_id else None
+        if profile is None or len(products) < 2:
+            return products
+        weights = profile.weights
+        recent = profile.recent
+        cache = self._product_features
+        scored = []
+        for position, p in enumerate(products):
+            features = cache.get(p.sku)
+            if features is None:
+                features = cache[p.sku] = _features(p.category, p.gender, p.price)
+            score = weights.get(features[0], 0.0) + weights.get(features[1], 0.0) + weights.get(features[2], 0.0)
+            if p.sku in recent:
+                score -= RECENT_PENALTY
+            scored.append((-score, position, p))
+        scored.sort()  # positions are unique, so products themselves are never compared
+        return [p for _, _, p in scored]
+
+    def on_catalog_change(self, change: Dict[str, Any]):
+        # The product's price/category/gender may have changed: recompute its features on next use
+        self._product_features.pop(change["sku"], None)
+
+profile_store = ProfileStore()
+order_events.subscribe(profile_store.on_order)
+catalog_events.subscribe(profile_store.on_catalog_change)
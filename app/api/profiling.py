@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import pstats
+import cProfile
+from typing import Dict, Any, Optional, List
+from .privacy import anonymize
+
+# Fraction of chat turns to profile (0 disables sampling; debug-flagged turns are always profiled)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Number of profiled turns kept on disk; older ones are deleted
+PROFILE_MAX_TURNS = int(os.getenv("PROFILE_MAX_TURNS", "50"))
+# Payload `data` field that forces profiling of a single turn
+PROFILE_FLAG = "debug_profile"
+# Clients may only force profiling when this is enabled (dev/staging); otherwise the flag is ignored
+PROFILE_ALLOW_FLAG = os.getenv("PROFILE_ALLOW_FLAG", "0") == "1"
+
+class _TurnProfile:
+    def __init__(self, query: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+
+class TurnProfiler:
+    """
+    Opt-in profiling of chat turns.
+    `start()` returns None for unsampled turns, so the normal path costs one
+    dict lookup and (only when sampling is enabled) one random() call.
+    Sampled turns run under cProfile; on `finish()` we write the raw .prof
+    (for snakeviz / pstats) and a JSON summary with the agent call tree and
+    time spent in the db layer and in fuzzy matching. Stats processing and
+    file I/O run in a worker thread so other connections are not stalled.
+    Note: cProfile sees every coroutine that runs on the loop while the turn
+    is awaiting, so concurrent sessions can leak into a profile under load.
+    """
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, directory: str = PROFILE_DIR,
+                 max_turns: int = PROFILE_MAX_TURNS, allow_flag: bool = PROFILE_ALLOW_FLAG):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_turns = max_turns
+        self.allow_flag = allow_flag
+        self.active: Optional[_TurnProfile] = None
+
+    def start(self, data: Dict[str, Any]) -> Optional[_TurnProfile]:
+        flagged = data.pop(PROFILE_FLAG, False) and self.allow_flag
+        if not flagged and not (self.sample_rate and random.random() < self.sample_rate):
+            return None
+        # cProfile can only have one active profiler per thread
+        if self.active is not None:
+            return None
+        profile = _TurnProfile(anonymize(str(data.get("content", ""))))  # summaries are kept on disk
+        self.active = profile
+        profile.profiler.enable()
+        return profile
+
+    async def finish(self, profile: _TurnProfile, response: Dict[str, Any]):
+        profile.profiler.disable()
+        self.active = None
+        wall_ms = (time.perf_counter() - profile.started) * 1000
+        try:
+            await asyncio.to_thread(self._write, profile, response, wall_ms)
+        except Exception as e:
+            print(f"Profile write failed: {e}")
+
+    def _write(self, profile: _TurnProfile, response: Dict[str, Any], wall_ms: float):
+        os.makedirs(self.directory, exist_ok=True)
+        stats = pstats.Stats(profile.profiler)
+        agent = response.get("agent_name") or "unknown"
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{profile.id}-{agent}")
+
+        stats.dump_stats(base + ".prof")
+        summary = {
+            "id": profile.id,
+            "query": profile.query,
+            "agent": agent,
+            "wall_ms": round(wall_ms, 3),
+            "db_ms": round(self._self_time(stats, _is_db) * 1000, 3),
+            "fuzzy_ms": round(self._self_time(stats, _is_fuzzy) * 1000, 3),
+            "call_tree": self._call_tree(stats),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Profiled turn {profile.id} ({agent}, {wall_ms:.1f} ms) -> {base}.json")
+        self._rotate()
+
+    def _self_time(self, stats: pstats.Stats, predicate) -> float:
+        # Sum of self time (tottime) so nested calls are not double-counted
+        return sum(tt for func, (cc, nc, tt, ct, callers) in stats.stats.items() if predicate(func))
+
+    def _call_tree(self, stats: pstats.Stats, depth: int = 4, width: int = 6) -> List[Dict[str, Any]]:
+        children: Dict[tuple, List[tuple]] = {}
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            for caller in callers:
+                children.setdefault(caller, []).append(func)
+
+        def node(func, level, path):
+            cc, nc, tt, ct, callers = stats.stats[func]
+            entry = {"func": _label(func), "calls": nc, "self_ms": round(tt * 1000, 3), "cum_ms": round(ct * 1000, 3)}
+            if level < depth:
+                kids = sorted((c for c in children.get(func, []) if c not in path),
+                              key=lambda c: stats.stats[c][3], reverse=True)[:width]
+                if kids:
+                    entry["children"] = [node(c, level + 1, path | {c}) for c in kids]
+            return entry
+
+        # Roots: each agent's process() method
+        roots = [f for f in stats.stats if f[0].endswith("agents.py") and f[2] == "process"]
+        roots.sort(key=lambda f: stats.stats[f][3], reverse=True)
+        return [node(f, 0, {f}) for f in roots]
+
+    def _rotate(self):
+        reports = sorted(
+            (os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in reports[:max(len(reports) - self.max_turns, 0)]:
+            for ext in (".json", ".prof"):
+                try:
+                    os.remove(path[:-len(".json")] + ext)
+                except OSError:
+                    pass
+
+def _is_db(func) -> bool:
+    filename = func[0].replace("\\", "/")
+    return filename.endswith(("api/services.py", "api/allocation.py"))
+
+def _is_fuzzy(func) -> bool:
+    filename, _, name = func
+    return "thefuzz" in filename or "rapidfuzz" in filename or "rapidfuzz" in name
+
+def _label(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+turn_profiler = TurnProfiler()
@@ -0,0 +1,90 @@
+import os
+import gzip
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Dict, Any, List, Optional
+from .privacy import anonymize
+
+# Directory for recorded sessions; recording is disabled when unset
+RECORD_SESSIONS_DIR = os.getenv("RECORD_SESSIONS_DIR", "")
+# Fraction of connections to record
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "1"))
+
+# Context values that are safe to keep verbatim; all other keys are recorded by name only
+SAFE_CONTEXT_KEYS = {"channel", "store"}
+
+class SessionRecording:
+    """Buffers one connection's turns in memory; written out once when the socket closes."""
+    def __init__(self):
+        self.id = os.urandom(6).hex()
+        self.started = time.time()
+        self.user = None
+        self.turns: List[Dict[str, Any]] = []
+        self._last = time.monotonic()
+
+    def message(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self.user is None and data.get("userId"):
+            self.user = hashlib.sha256(str(data["userId"]).encode()).hexdigest()[:12]
+        raw = str(data.get("content", ""))
+        content = anonymize(raw)
+        turn = {
+            "gap_ms": round((now - self._last) * 1000, 1),
+            "content": content,
+            # The replayed text differs from what was answered, so replay skips its comparison
+            "scrubbed": content != raw,
+            "context_keys": sorted(k for k in data if k != "content"),
+            "context": {k: data[k] for k in SAFE_CONTEXT_KEYS if k in data},
+            "agent": None,
+            "products": [],
+            "response_chars": 0,
+            "latency_ms": None,
+            "cancelled": True,  # cleared when the final frame goes out
+        }
+        self._last = now
+        self.turns.append(turn)
+        return turn
+
+    def response(self, turn: Dict[str, Any], response: Dict[str, Any], received: float):
+        turn["agent"] = response.get("agent_name")
+        turn["products"] = [p.get("sku") for p in response.get("products") or []]
+        turn["response_chars"] = len(response.get("content", ""))
+        turn["latency_ms"] = round((time.monotonic() - received) * 1000, 1)
+        turn["cancelled"] = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "started": self.started, "user": self.user, "turns": self.turns}
+
+class SessionRecorder:
+    """
+    Optional recorder of /ws/chat sessions for replay (see app/api/replay.py).
+    Sessions are appended as one JSON line each to a gzip file per day;
+    gzip members can be concatenated, so appending is safe.
+    """
+    def __init__(self, directory: str = RECORD_SESSIONS_DIR, sample_rate: float = RECORD_SAMPLE_RATE):
+        self.directory = directory
+        self.sample_rate = sample_rate
+
+    def start(self) -> Optional[SessionRecording]:
+        if not self.directory or random.random() >= self.sample_rate:
+            return None
+        return SessionRecording()
+
+    async def finish(self, recording: SessionRecording):
+        if not recording.turns:
+            return
+        try:
+            await asyncio.to_thread(self._write, recording.to_dict())
+        except Exception as e:
+            print(f"Session recording failed: {e}")
+
+    def _write(self, session: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"sessions-{time.strftime('%Y%m%d')}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(session) + "\n")
+
+session_recorder = SessionRecorder()
@@ -0,0 +1,214 @@
+"""
+Replay recorded chat sessions in-process against the ASGI app.
+
+    python -m app.api.replay recordings/sessions-20261019.jsonl.gz --speed 1
+    python -m app.api.replay recordings/*.jsonl.gz --speed 10
+    python -m app.api.replay recordings/*.jsonl.gz --speed max --json
+
+Each session gets its own websocket connection. Turns are sent one at a time:
+the driver waits for the previous reply, then for the rest of the recorded
+think-time divided by --speed (no wait at all with `max`). Superseded/cancelled
+turns from the recording are therefore replayed as normal turns; they, and turns
+whose text was scrubbed of personal data, are left out of the comparison. The session's
+hashed user is sent as `userId`, so orders and personalized ranking follow one
+consistent shopper as they did when recorded.
+Reports routing / product drift against the recording and latency percentiles.
+"""
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any, List, Optional
+
+TERMINAL_FRAMES = {"final", "cancelled", "system"}
+
+def load_sessions(paths: List[str]) -> List[Dict[str, Any]]:
+    sessions = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    sessions.append(json.loads(line))
+    return sessions
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1], 1)}
+
+class ASGIWebSocket:
+    """Minimal in-process websocket client speaking raw ASGI to `app`."""
+    def __init__(self, app, path: str = "/ws/chat"):
+        self.app = app
+        self.path = path
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": self.path,
+            "raw_path": self.path.encode(), "root_path": "", "query_string": b"", "headers": [],
+            "client": ("replay", 0), "server": ("replay", 80), "subprotocols": [],
+        }
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"Connection rejected: {message}")
+
+    async def send_json(self, data: Dict[str, Any]):
+        await self._to_app.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self) -> Dict[str, Any]:
+        while True:
+            message = await self._from_app.get()
+            if message["type"] == "websocket.send":
+                return json.loads(message.get("text") or message.get("bytes"))
+            if message["type"] == "websocket.close":
+                raise ConnectionError("Server closed the connection")
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+class Lifespan:
+    """Runs the app's ASGI lifespan startup/shutdown so db.connect etc. happen as in production."""
+    def __init__(self, app):
+        self.app = app
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "lifespan.startup"})
+        await self._from_app.get()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._to_app.put({"type": "lifespan.shutdown"})
+        await self._from_app.get()
+        await self._task
+
+async def replay_session(app, session: Dict[str, Any], speed: Optional[float]) -> List[Dict[str, Any]]:
+    ws = ASGIWebSocket(app)
+    await ws.connect()
+    results = []
+    try:
+        last_sent = time.perf_counter()
+        for turn in session["turns"]:
+            if speed:
+                wait = turn.get("gap_ms", 0) / 1000 / speed - (time.perf_counter() - last_sent)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            data = dict(turn.get("context", {}))
+            if session.get("user"):
+                # Stand-in for the recorded shopper, so orders and personalization line up again
+                data["userId"] = session["user"]
+            data["content"] = turn["content"]
+            sent = last_sent = time.perf_counter()
+            await ws.send_json({"type": "user_message", "data": data})
+
+            first_chunk = None
+            while True:
+                frame = await ws.receive_json()
+                if first_chunk is None and frame.get("type") in ("partial", "final"):
+                    first_chunk = time.perf_counter()
+                if frame.get("type") in TERMINAL_FRAMES:
+                    break
+            done = time.perf_counter()
+
+            products = [p.get("sku") for p in frame.get("products") or []]
+            results.append({
+                "session": session.get("id"),
+                "content": turn["content"],
+                "recorded_agent": turn.get("agent"),
+                "agent": frame.get("agentName"),
+                "recorded_products": turn.get("products", []),
+                "products": products,
+                "compared": not turn.get("cancelled") and not turn.get("scrubbed"),
+                "first_chunk_ms": ((first_chunk or done) - sent) * 1000,
+                "total_ms": (done - sent) * 1000,
+            })
+    finally:
+        await ws.close()
+    return results
+
+async def run(paths: List[str], speed: Optional[float], concurrency: int) -> Dict[str, Any]:
+    from .index import app
+    from .recorder import session_recorder
+    from .analytics import query_analytics
+
+    # Don't record the replay itself, and keep its turns out of the production query stats:
+    # analytics load from / snapshot to a throwaway directory for the duration of the run
+    session_recorder.directory = ""
+    sessions = load_sessions(paths)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(session):
+        async with semaphore:
+            return await replay_session(app, session, speed)
+
+    with tempfile.TemporaryDirectory(prefix="replay-analytics-") as analytics_dir:
+        query_analytics.directory = analytics_dir
+        started = time.perf_counter()
+        async with Lifespan(app):
+            per_session = await asyncio.gather(*[limited(s) for s in sessions])
+        elapsed = time.perf_counter() - started
+
+    turns = [t for session in per_session for t in session]
+    compared = [t for t in turns if t["compared"]]
+    agent_drift = [t for t in compared if t["agent"] != t["recorded_agent"]]
+    product_drift = [t for t in compared if t["products"] != t["recorded_products"]]
+    return {
+        "sessions": len(sessions),
+        "turns": len(turns),
+        "elapsed_s": round(elapsed, 2),
+        "compared": len(compared),
+        "agentMismatches": len(agent_drift),
+        "productMismatches": len(product_drift),
+        "examples": [
+            {k: t[k] for k in ("session", "content", "recorded_agent", "agent", "recorded_products", "products")}
+            for t in (agent_drift + product_drift)[:10]
+        ],
+        "firstChunkMs": percentiles([t["first_chunk_ms"] for t in turns]),
+        "totalMs": percentiles([t["total_ms"] for t in turns]),
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded chat sessions against the app.")
+    parser.add_argument("paths", nargs="+", help="Recorded .jsonl or .jsonl.gz files")
+    parser.add_argument("--speed", default="max", help="Think-time speed-up: 1, N, or 'max' (no waiting)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Sessions replayed at once")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    speed = None if args.speed == "max" else float(args.speed)
+    report = asyncio.run(run(args.paths, speed, args.concurrency))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Replayed {report['turns']} turns from {report['sessions']} sessions in {report['elapsed_s']}s")
+        print(f"Routing mismatches: {report['agentMismatches']}/{report['compared']}")
+        print(f"Product mismatches: {report['productMismatches']}/{report['compared']}")
+        for ex in report["examples"]:
+            print(f"  [{ex['session']}] '{ex['content']}': {ex['recorded_agent']} {ex['recorded_products']} -> {ex['agent']} {ex['products']}")
+        print(f"First chunk ms: {report['firstChunkMs']}")
+        print(f"Total ms:       {report['totalMs']}")
+    # Non-zero exit on drift so this can gate a release
+    return 1 if report["agentMismatches"] or report["productMismatches"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
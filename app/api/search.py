@@ -0,0 +1,201 @@
+import re
+import math
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Iterable, Tuple
+
+# Words that carry meaning in chat but are not catalog vocabulary.
+# They are never "corrected" (so "shop" does not become "shoe", "me" never becomes "men").
+CHAT_WORDS = {
+    "show", "shop", "want", "need", "have", "some", "with", "what", "where", "when", "like",
+    "looking", "recommend", "find", "buy", "cart", "stock", "check", "order", "track", "pickup",
+    "store", "under", "price", "size", "color", "colour", "please", "thanks", "hello", "this",
+    "that", "them", "item", "items", "something", "anything", "good", "best", "cheap", "much",
+    "many", "available", "deliver", "ship", "checkout", "remove", "quantity", "change", "from",
+    "your", "mine", "about", "also", "more", "less", "than", "give", "tell", "does", "near",
+}
+
+# Ordinary product words the catalog does not carry. They are real words, not typos,
+# so they are never rewritten into a nearby catalog word ("skirt" must not become "shirt").
+COMMON_WORDS = {
+    "skirt", "skirts", "shorts", "short", "tshirt", "tshirts", "tee", "tees", "shirts", "pants",
+    "trousers", "jacket", "jackets", "hoodie", "hoodies", "sweater", "coat", "coats", "socks",
+    "boots", "boot", "sandals", "slippers", "flats", "watch", "watches", "bag", "bags", "belt",
+    "belts", "caps", "hats", "scarf", "blouse", "tops", "suit", "suits", "kurta", "saree",
+    "phones", "tablet", "laptop", "charger", "cover", "case",
+}
+
+# Category synonyms the agents already understand; included so typos of them get fixed too
+DOMAIN_WORDS = [
+    "shoes", "sneakers", "footwear", "running", "kicks", "clothing", "clothes", "apparel",
+    "wear", "dress", "shirt", "jeans", "casual", "outfit", "phone", "electronics",
+    "men", "women", "male", "female",
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+def _trigrams(text: str) -> Set[str]:
+    grams = set()
+    for token in _tokens(text):
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i+3])
+    return grams
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i+1:])
+        result |= nxt
+        frontier = nxt
+    return result
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (Damerau-Levenshtein with adjacent transpositions)."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                cur[j] = min(cur[j], prev2[j-2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+class CatalogSearchIndex:
+    """
+    Candidate generation ahead of thefuzz scoring.
+
+    - SymSpell-style spelling correction: every catalog word is stored under all
+      of its deletions (up to `max_distance`), so a misspelt token is corrected
+      by looking up its own deletions instead of comparing against the whole vocabulary.
+    - Trigram prefilter: an inverted index trigram -> product names, used to cut
+      the choices handed to WRatio / partial_ratio / token_set_ratio down to a shortlist.
+    Both lookups cost roughly the same regardless of catalog size.
+    """
+    def __init__(self, max_distance: int = 2, shortlist_size: int = 8, cache_size: int = 1024):
+        self.max_distance = max_distance
+        self.shortlist_size = shortlist_size
+        self.cache_size = cache_size
+        # Optional provider of popular queries, replayed after every rebuild to pre-warm caches
+        self.warm_queries: Optional[Callable[[], List[str]]] = None
+        self.version = None
+        self._scored: "OrderedDict[str, List[Tuple[float, str]]]" = OrderedDict()
+        self._word_freq: Counter = Counter()
+        self._deletes: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._name_grams: Dict[str, int] = {}
+        self._corrections: Dict[str, str] = {}
+
+    def ensure(self, products: Iterable, version) -> "CatalogSearchIndex":
+        """Rebuild only when the catalog version changed."""
+        if version != self.version or not self._name_grams:
+            self.build(products)
+            self.version = version
+            if self.warm_queries:
+                self.warm(self.warm_queries())
+        return self
+
+    def warm(self, queries: Iterable[str]):
+        """Populate the correction and shortlist caches for known-popular queries."""
+        for q in queries:
+            self._score(self.correct(q))
+
+    def build(self, products: Iterable):
+        self._word_freq = Counter()
+        self._deletes = {}
+        self._grams = {}
+        self._name_grams = {}
+        self._corrections = {}
+        self._scored = OrderedDict()
+        for p in products:
+            for text in (p.name, p.category, p.description or ""):
+                self._word_freq.update(_tokens(text))
+            grams = _trigrams(p.name)
+            self._name_grams[p.name] = len(grams)
+            for g in grams:
+                self._grams.setdefault(g, set()).add(p.name)
+        self._word_freq.update(DOMAIN_WORDS)
+        for word in self._word_freq:
+            if len(word) < 3 or word.isdigit():
+                continue
+            for d in _deletes(word, self.max_distance):
+                self._deletes.setdefault(d, set()).add(word)
+
+    # -------------------------
+    # Spelling correction
+    # -------------------------
+    def correct_word(self, token: str) -> str:
+        if (len(token) < 4 or token.isdigit() or token in self._word_freq
+                or token in CHAT_WORDS or token in COMMON_WORDS):
+            return token
+        cached = self._corrections.get(token)
+        if cached is not None:
+            return cached
+        # One edit only, except for long tokens: at distance 2 a short word is as likely
+        # to be a different real word ("tshirts" -> "shirt") as a typo
+        max_distance = 1 if len(token) < 8 else self.max_distance
+        best = None
+        for d in _deletes(token, max_distance):
+            for word in self._deletes.get(d, ()):
+                dist = _edit_distance(token, word, max_distance)
+                if dist <= max_distance:
+                    key = (dist, -self._word_freq[word], word)
+                    if best is None or key < best:
+                        best = key
+        corrected = best[2] if best else token
+        if len(self._corrections) < 10000:
+            self._corrections[token] = corrected
+        return corrected
+
+    def correct(self, text: str) -> str:
+        """Return `text` with misspelt catalog words replaced, e.g. 'runing shos' -> 'running shoes'."""
+        return _TOKEN_RE.sub(lambda m: self.correct_word(m.group(0)), text.lower())
+
+    # -------------------------
+    # Trigram prefilter
+    # -------------------------
+    def shortlist(self, text: str, allowed: Optional[Set[str]] = None, limit: Optional[int] = None) -> List[str]:
+        """Product names sharing the most trigrams with `text` (Dice-style overlap), best first."""
+        limit = limit or self.shortlist_size
+        result = []
+        for _, name in self._score(text):
+            if allowed is None or name in allowed:
+                result.append(name)
+                if len(result) == limit:
+                    break
+        return result
+
+    def _score(self, text: str) -> List[Tuple[float, str]]:
+        cached = self._scored.get(text)
+        if cached is not None:
+            self._scored.move_to_end(text)
+            return cached
+        query = _trigrams(text)
+        overlap: Counter = Counter()
+        for g in query:
+            for name in self._grams.get(g, ()):
+                overlap[name] += 1
+        scored = sorted(
+            ((shared / math.sqrt(len(query) * self._name_grams[name]), name) for name, shared in overlap.items()),
+            reverse=True
+        )
+        self._scored[text] = scored
+        if len(self._scored) > self.cache_size:
+            self._scored.popitem(last=False)
+        return scored
+
+# Shared index over the product catalog, rebuilt when db.catalog_version changes
+catalog_index = CatalogSearchIndex()
@@ -5,6 +5,8 @@ from typing import List, Dict, Optional
 from dataclasses import dataclass
 from dotenv import load_dotenv
 from .models import Product as ProductModel  # pydantic model used by the rest of the app
+from .events import stock_events, order_events, catalog_events
+from .allocation import AllocationEngine
 
 load_dotenv()
 DATABASE_URL = os.getenv("PYTHON_DATABASE_URL")
@@ -222,9 +224,27 @@ class MockDatabaseService:
             "SHOE-HL-006": {"Mall of India": 12},
         }
 
+        # sku -> product index so order placement resolves a whole cart in one pass
+        self._products_by_sku: Dict[str, _MockProduct] = {p.sku: p for p in self._products}
+
+        # Ship from warehouses first to keep store shelves stocked for walk-ins
+        # (an order placed from a store still ships from that store first).
+        # Only stores are open to customers for pickup.
+        self.allocator = AllocationEngine(self._inventory, location_priority={
+            "Main Warehouse": 0,
+            "Warehouse": 1,
+            "Mall of India": 2,
+            "Store_A": 3,
+            "Store_B": 3,
+        }, pickup_locations={"Mall of India", "Store_A", "Store_B"})
+
         self._orders: List[Dict] = []
+        self._order_items: List[Dict] = []
         self._connected = False
 
+        # Bumped on catalog changes so derived search indexes know to rebuild
+        self.catalog_version = 0
+
     async def connect(self):
         # Nothing to do for mock but we keep API parity
         self._connected = True
@@ -265,37 +285,208 @@ class MockDatabaseService:
                 return v
         return {}
 
-    async def create_order(self, user_id: str, items: List[Dict], total: float) -> str:
+    async def get_products_by_skus(self, skus: List[str]) -> Dict[str, ProductModel]:
+        """
+        Batch lookup: return {sku: Product} for every known SKU in `skus`.
+        Unknown SKUs are simply absent from the result.
+        """
+        found = {}
+        for sku in set(skus):
+            mp = self._products_by_sku.get(sku)
+            if mp:
+                found[sku] = self._to_pydantic(mp)
+        return found
+
+    async def create_order(self, user_id: str, items: List[Dict], total: Optional[float] = None,
+                           origin: Optional[str] = None) -> str:
+        """
+        Create an order with its OrderItem rows and return its id.
+        `items` is expected to be list of dicts: {"sku":..., "quantity":...}.
+        Prices come from the catalog. `total`, if given, must equal the sum of the lines.
+        Stock is allocated to as few locations as possible, nearest to `origin` if given.
+        Raises ValueError (and changes nothing) if any SKU is unknown or short on stock.
+        """
+        return (await self.create_orders_bulk([{"user_id": user_id, "items": items, "total": total, "origin": origin}]))[0]
+
+    async def create_orders_bulk(self, orders: List[Dict]) -> List[str]:
+        """
+        Place several orders at once (B2B / kiosk batches).
+        Each order is {"user_id":..., "items": [...], "total": optional, "origin": optional store}.
+        All SKUs across the batch are resolved, priced and stock-checked in a single pass,
+        then every Order/OrderItem row is written together: either all orders are
+        placed or none are. A client-supplied `total` is only a cross-check: the
+        stored amount is always computed from catalog prices.
+        """
+        # 1. Merge lines per order and aggregate demand per distinct SKU
+        if not orders:
+            raise ValueError("No orders given")
+        merged_orders = []
+        demand: Dict[str, int] = {}
+        for order in orders:
+            lines: Dict[str, int] = {}
+            for it in order.get("items", []):
+                sku = (it.get("sku") or "").strip()
+                qty = int(it.get("quantity", 1))
+                if qty <= 0:
+                    raise ValueError(f"Invalid quantity {qty} for {sku}")
+                lines[sku] = lines.get(sku, 0) + qty
+                demand[sku] = demand.get(sku, 0) + qty
+            if not lines:
+                raise ValueError("Order has no items")
+            merged_orders.append((order, lines))
+
+        # 2. Resolve products and validate stock once per distinct SKU
+        for sku, qty in demand.items():
+            if sku not in self._products_by_sku:
+                raise ValueError(f"Unknown SKU: {sku}")
+            available = self.allocator.total(sku)
+            if available < qty:
+                raise ValueError(f"Insufficient stock for {sku}: requested {qty}, available {available}")
+
+        # Price every order from the catalog; a client total that disagrees is rejected
+        totals = []
+        for order, lines in merged_orders:
+            computed_total = sum(float(self._products_by_sku[sku].price) * qty for sku, qty in lines.items())
+            total = order.get("total")
+            if total is not None and round(float(total), 2) != round(computed_total, 2):
+                raise ValueError(f"Order total {total} does not match computed total {computed_total}")
+            totals.append(computed_total)
+
+        # 3. Commit: aggregate stock was checked above, so nothing below can fail
+        # and the batch is applied atomically
+        placed = []
+        for (order, lines), computed_total in zip(merged_orders, totals):
+            order_id = str(uuid.uuid4())
+            allocation = self.allocator.plan(lines, origin=order.get("origin"))
+            self.allocator.commit(allocation)
+            for sku, qty in lines.items():
+                price = float(self._products_by_sku[sku].price)
+                self._order_items.append({
+                    "id": str(uuid.uuid4()),
+                    "orderId": order_id,
+                    "productId": self._products_by_sku[sku].id,
+                    "sku": sku,
+                    "quantity": qty,
+                    "price": price,
+                })
+            placed.append({
+                "id": order_id,
+                "userId": order.get("user_id"),
+                "items": [{"sku": sku, "quantity": qty} for sku, qty in lines.items()],
+                "totalAmount": computed_total,
+                "allocations": {
+                    sku: [{"location": loc, "quantity": qty} for loc, qty in picks]
+                    for sku, picks in allocation.items()
+                },
+                "fulfillmentLocations": sorted({loc for picks in allocation.values() for loc, _ in picks}),
+                "status": "PAID",
+                "paymentStatus": "SUCCESS",
+            })
+        self._orders.extend(placed)
+
+        for sku in demand:
+            stock_events.publish(sku, self.allocator.total(sku))
+        # Only this batch's orders, never the existing history
+        for order in placed:
+            order_events.publish({
+                "id": order["id"],
+                "userId": order["userId"],
+                "lines": self._order_lines(order),
+            })
+        return [order["id"] for order in placed]
+
+    async def get_order_lines(self) -> List[Dict]:
+        """
+        Flattened purchase history, oldest first: one dict per OrderItem with
+        userId and the product attributes needed for personalization.
+        """
+        lines = []
+        for order in self._orders:
+            for line in self._order_lines(order):
+                line["userId"] = order["userId"]
+                lines.append(line)
+        return lines
+
+    def _order_lines(self, order: Dict) -> List[Dict]:
+        lines = []
+        for it in order["items"]:
+            mp = self._products_by_sku.get(it["sku"])
+            if mp:
+                lines.append({
+                    "sku": mp.sku,
+                    "quantity": it["quantity"],
+                    "price": float(mp.price),
+                    "category": mp.category,
+                    "gender": mp.gender,
+                })
+        return lines
+
+    async def update_inventory(self, sku: str, location: str, quantity: int):
+        """
+        Ingestion hook (restocks, store feeds): set the on-hand quantity of `sku`
+        at `location` and notify stock subscribers.
         """
-        Create a simple order record and return its id.
-        `items` is expected to be list of dicts: {"sku":..., "quantity":..., "price":...}
+        self.allocator.set_quantity(sku, location, int(quantity))
+        stock_events.publish(sku, self.allocator.total(sku))
+
+    async def upsert_product(self, product: Dict) -> str:
+        """
+        Ingestion hook (catalog feeds): add a product, or update the one with the
+        same `sku`, bump `catalog_version` so search indexes rebuild, and notify
+        catalog subscribers.
         """
-        order_id = str(uuid.uuid4())
-        order = {
-            "id": order_id,
-            "userId": user_id,
-            "items": items,
-            "totalAmount": float(total),
-            "status": "PAID" if float(total) == 0.0 else "PAID",
-            "paymentStatus": "SUCCESS",
+        current = self._products_by_sku.get(product["sku"])
+        fields = {k: product[k] for k in ("name", "description", "price", "category", "gender", "imageUrl") if k in product}
+        if current is None:
+            current = _MockProduct(id=str(uuid.uuid4()), sku=product["sku"], **fields)
+            self._products.append(current)
+            self._products_by_sku[current.sku] = current
+        else:
+            for k, v in fields.items():
+                setattr(current, k, v)
+        self.catalog_version += 1
+        catalog_events.publish({"sku": current.sku, "version": self.catalog_version})
+        return current.id
+
+    async def get_locations(self) -> List[str]:
+        return self.allocator.locations()
+
+    async def get_location_versions(self, location: str) -> Dict[str, int]:
+        """Change counters for one location's assortment and stock (cheap staleness check)."""
+        return {
+            "catalog": self.catalog_version,
+            "assortment": self.allocator.assortment_versions.get(location, 0),
+            "stock": self.allocator.stock_versions.get(location, 0),
         }
-        self._orders.append(order)
-
-        # reduce inventory for each item (best-effort)
-        for it in items:
-            sku = it.get("sku")
-            qty = int(it.get("quantity", 1))
-            if sku and sku in self._inventory:
-                # subtract from first location that has enough stock, otherwise subtract where available
-                for loc, cur in list(self._inventory[sku].items()):
-                    if cur >= qty:
-                        self._inventory[sku][loc] = cur - qty
-                        break
-                    elif cur > 0:
-                        # consume partial stock and continue
-                        qty -= cur
-                        self._inventory[sku][loc] = 0
-        return order_id
+
+    async def get_location_stock(self, location: str) -> Dict[str, int]:
+        """sku -> qty for every SKU the location carries."""
+        return self.allocator.stock_at(location)
+
+    async def get_location_catalog(self, location: str) -> List[ProductModel]:
+        """Products carried at `location`, with inStock reflecting that location's shelf only."""
+        stock = self.allocator.stock_at(location)
+        results = []
+        for sku, qty in stock.items():
+            mp = self._products_by_sku.get(sku)
+            if mp:
+                product = self._to_pydantic(mp)
+                product.inStock = qty > 0
+                results.append(product)
+        return results
+
+    async def get_pickup_locations(self) -> List[str]:
+        """Locations customers can collect orders from (stores, not warehouses)."""
+        return self.allocator.locations_for_pickup()
+
+    async def check_pickup(self, sku: str, location: str, quantity: int = 1) -> bool:
+        """O(1): can `quantity` units of `sku` be collected at `location`?"""
+        pickup = self.allocator.pickup_locations
+        return (pickup is None or location in pickup) and self.allocator.is_available_at(location, sku, quantity)
+
+    async def find_pickup_location(self, sku: str, quantity: int = 1, origin: Optional[str] = None) -> Optional[str]:
+        """Pickup location with enough stock: `origin` itself, else the nearest / preferred store."""
+        return self.allocator.best_pickup_location(sku, quantity, origin)
 
     async def process_payment(self, amount: float, method: str) -> bool:
         # simple rule: fail if amount > 10000
@@ -312,7 +503,7 @@ class MockDatabaseService:
             category=mp.category,
             gender=mp.gender,
             imageUrl=mp.imageUrl or None,
-            inStock=(sum(self._inventory.get(mp.sku, {}).values()) > 0)
+            inStock=(self.allocator.total(mp.sku) > 0)
         )
 
 
@@ -324,6 +515,7 @@ class MockDatabaseService:
 class RealDatabaseService:
     def __init__(self, database):
         self._db = database
+        self.catalog_version = 0
 
     async def connect(self):
         await self._db.connect()
@@ -339,7 +531,51 @@ class RealDatabaseService:
     async def check_inventory(self, sku: str) -> Dict[str, int]:
         raise NotImplementedError()
 
-    async def create_order(self, user_id: str, items: List[Dict], total: float) -> str:
+    async def get_products_by_skus(self, skus: List[str]) -> Dict[str, ProductModel]:
+        raise NotImplementedError()
+
+    async def create_order(self, user_id: str, items: List[Dict], total: Optional[float] = None,
+                           origin: Optional[str] = None) -> str:
+        raise NotImplementedError()
+
+    async def update_inventory(self, sku: str, location: str, quantity: int):
+        raise NotImplementedError()
+
+    async def upsert_product(self, product: Dict) -> str:
+        # Real catalog writes must also bump self.catalog_version (or read it from the DB)
+        raise NotImplementedError()
+
+    async def get_locations(self) -> List[str]:
+        raise NotImplementedError()
+
+    async def get_order_lines(self) -> List[Dict]:
+        # SELECT o.userId, p.sku, oi.quantity, oi.price, p.category, p.gender
+        # FROM OrderItem oi JOIN "Order" o ON o.id = oi.orderId JOIN Product p ON p.id = oi.productId
+        # ORDER BY o.createdAt
+        raise NotImplementedError()
+
+    async def get_location_versions(self, location: str) -> Dict[str, int]:
+        raise NotImplementedError()
+
+    async def get_location_stock(self, location: str) -> Dict[str, int]:
+        # SELECT p.sku, i.quantity FROM Inventory i JOIN Product p ON p.id = i.productId WHERE i.location = ?
+        raise NotImplementedError()
+
+    async def get_location_catalog(self, location: str) -> List[ProductModel]:
+        raise NotImplementedError()
+
+    async def get_pickup_locations(self) -> List[str]:
+        raise NotImplementedError()
+
+    async def check_pickup(self, sku: str, location: str, quantity: int = 1) -> bool:
+        raise NotImplementedError()
+
+    async def find_pickup_location(self, sku: str, quantity: int = 1, origin: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError()
+
+    async def create_orders_bulk(self, orders: List[Dict]) -> List[str]:
+        # Should run as one transaction: a single SELECT ... WHERE sku IN (...) FOR UPDATE,
+        # then executemany() for Order/OrderItem inserts and Inventory updates.
         raise NotImplementedError()
 
     async def process_payment(self, amount: float, method: str) -> bool:
@@ -35,10 +35,18 @@ interface Receipt {
 
 interface Product {
     id: string;
+    sku: string;
     name: string;
     price: number;
     description: string;
     imageUrl?: string;
+    inStock?: boolean;
+}
+
+interface StockUpdate {
+    sku: string;
+    quantity: number;
+    inStock: boolean;
 }
 
 export default function ChatInterface() {
@@ -89,10 +97,19 @@ export default function ChatInterface() {
                             setSelectedProduct(payload.product_context);
                         }
                         setMessages((prev) => {
-                            const last = prev[prev.length - 1];
+                            // A reply that must be delivered (e.g. a placed order) can finish after
+                            // the next user message, so complete its partial wherever it sits
+                            let target = prev.length - 1;
+                            for (let i = prev.length - 1; i >= 0; i--) {
+                                if (prev[i].role === "assistant" && prev[i].partial) {
+                                    target = i;
+                                    break;
+                                }
+                            }
+                            const last = prev[target];
                             if (last && last.role === "assistant") {
                                 const copy = [...prev];
-                                copy[copy.length - 1] = {
+                                copy[target] = {
                                     role: "assistant",
                                     content: payload.content,
                                     partial: false,
@@ -113,6 +130,36 @@ export default function ChatInterface() {
                             }
                         });
                         setLoading(false);
+                    } else if (payload.type === "cancelled") {
+                        // Messages dropped before they were answered have nothing on screen
+                        if (payload.started === false) return;
+                        // A newer message superseded this reply; drop its half-streamed text.
+                        // The new user message is usually already below it, so search backwards.
+                        setMessages((prev) => {
+                            for (let i = prev.length - 1; i >= 0; i--) {
+                                if (prev[i].role === "assistant" && prev[i].partial) {
+                                    return [...prev.slice(0, i), ...prev.slice(i + 1)];
+                                }
+                            }
+                            return prev;
+                        });
+                    } else if (payload.type === "stock_update") {
+                        // Live stock changes for products already on screen
+                        const updates = new Map<string, boolean>(
+                            (payload.updates as StockUpdate[]).map((u) => [u.sku, u.inStock])
+                        );
+                        setMessages((prev) => prev.map((msg) => {
+                            if (!msg.products || !msg.products.some((p) => updates.has(p.sku))) return msg;
+                            return {
+                                ...msg,
+                                products: msg.products.map((p) =>
+                                    updates.has(p.sku) ? { ...p, inStock: updates.get(p.sku) } : p
+                                )
+                            };
+                        }));
+                        setSelectedProduct((prev) =>
+                            prev && updates.has(prev.sku) ? { ...prev, inStock: updates.get(prev.sku) } : prev
+                        );
                     } else if (payload.type === "system") {
                         setMessages((prev) => [...prev, { role: "assistant", content: payload.content }]);
                     }
@@ -278,6 +325,9 @@ export default function ChatInterface() {
                                                 </div>
                                                 <div className="text-xs font-semibold text-zinc-800 dark:text-zinc-100 truncate" title={prod.name}>{prod.name}</div>
                                                 <div className="text-xs text-zinc-500">₹{prod.price}</div>
+                                                {prod.inStock === false && (
+                                                    <div className="text-xs font-medium text-red-500">Out of stock</div>
+                                                )}
                                             </div>
                                         ))}
                                     </div>